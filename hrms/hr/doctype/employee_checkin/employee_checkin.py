@@ -6,15 +6,33 @@ import frappe
 import datetime
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import cint, get_datetime, get_link_to_form, nowdate, now_datetime, get_time, getdate
+from frappe.model.naming import make_autoname
+from frappe.utils import cint, create_batch, get_datetime, nowdate, now_datetime, getdate
 from datetime import datetime as dt, timedelta
-from dateutil.relativedelta import relativedelta
 
 from hrms.hr.doctype.shift_assignment.shift_assignment import (
 	get_actual_start_end_datetime_of_shift,
 )
 from hrms.hr.utils import validate_active_employee
-from hrms.utils import config_env_service, get_all_date_in_month
+from hrms.utils import config_env_service
+
+LUNCH_TIME = 1.5
+START_MIDDAY = datetime.time(12, 0, 0)
+END_MIDDAY = datetime.time(13, 30, 0)
+SATURDAY_SHIFT_END = datetime.time(12, 0, 0)
+EMPLOYEE_CHUNK_SIZE = 200
+
+# (notification log type, latest log type) -> "pass" or the log type to remind the employee of
+NOTIFICATION_ACTIONS = {
+	("IN", "IN"): "pass",
+	("OUT", "IN"): "OUT",
+	("OUT", "OUT"): "pass",
+	("IN", "OUT"): "IN",
+}
+
+# seconds to wait for the bot, so an unresponsive bot can not hang the scheduled job
+NOTIFICATION_TIMEOUT = 10
+
 
 class EmployeeCheckin(Document):
 	def validate(self):
@@ -23,7 +41,10 @@ class EmployeeCheckin(Document):
 		self.fetch_shift()
 
 	def validate_duplicate_log(self):
-		doc = frappe.db.exists(
+		if not (self.employee and self.time):
+			return
+
+		doc = frappe.db.get_value(
 			"Employee Checkin",
 			{
 				"employee": self.employee,
@@ -31,6 +52,7 @@ class EmployeeCheckin(Document):
 				"name": ("!=", self.name),
 				"log_type": self.log_type,
 			},
+			"name",
 		)
 		if doc:
 			doc_link = frappe.get_desk_link("Employee Checkin", doc)
@@ -175,29 +197,16 @@ def mark_attendance_and_link_log(
 
 
 def calculate_working_hours_by_shift_type(logs):
-	lunch_time = 1.5
 	total_hours = 0
 	in_time = out_time = None
 	is_saturday = dt.today().weekday() == 5
-	START_MIDDAY = datetime.time(12, 0, 0)
-	END_MIDDAY = datetime.time(13, 30, 0)
 
 	date = getdate()
-	saturday_shift_end = dt.combine(date, get_time("12:00:00")) # saturday shift end is specific day so need config manually
+	saturday_shift_end = dt.combine(date, SATURDAY_SHIFT_END) # saturday shift end is specific day so need config manually
 	shift_start = logs[0].shift_start
 	shift_end = logs[0].shift_end if not is_saturday else saturday_shift_end
 
-	first_in_log_index = find_index_in_dict(logs, "log_type", "IN")
-	first_in_log = (
-		logs[first_in_log_index] if first_in_log_index or first_in_log_index == 0 else None
-	)
-
-	last_out_log_index = find_index_in_dict(reversed(logs), "log_type", "OUT")
-	last_out_log = (
-		logs[len(logs) - 1 - last_out_log_index]
-		if last_out_log_index or last_out_log_index == 0
-		else None
-	)
+	first_in_log, last_out_log = get_first_in_and_last_out_logs(logs)
 
 	if first_in_log and last_out_log:
 		in_time, out_time = first_in_log.time, last_out_log.time
@@ -215,7 +224,7 @@ def calculate_working_hours_by_shift_type(logs):
 		is_after_early_afternoon = last_out_time > END_MIDDAY
 
 		if not is_midday_time_range and is_after_early_afternoon and not is_saturday:
-			total_hours -= lunch_time
+			total_hours -= LUNCH_TIME
 
 	return total_hours, in_time, out_time
 
@@ -237,23 +246,15 @@ def calculate_working_hours(logs, check_in_out_type, working_hours_calc_type):
 			# assumption in this case: First log always taken as IN, Last log always taken as OUT
 			total_hours = time_diff_in_hours(in_time, logs[-1].time)
 		elif working_hours_calc_type == "Every Valid Check-in and Check-out":
-			logs = logs[:]
-			while len(logs) >= 2:
-				total_hours += time_diff_in_hours(logs[0].time, logs[1].time)
-				del logs[:2]
+			# pair every IN (even index) with the OUT that follows it, an unpaired last log is ignored
+			total_hours = sum(
+				time_diff_in_hours(in_log.time, out_log.time)
+				for in_log, out_log in zip(logs[::2], logs[1::2])
+			)
 
 	elif check_in_out_type == "Strictly based on Log Type in Employee Checkin":
 		if working_hours_calc_type == "First Check-in and Last Check-out":
-			first_in_log_index = find_index_in_dict(logs, "log_type", "IN")
-			first_in_log = (
-				logs[first_in_log_index] if first_in_log_index or first_in_log_index == 0 else None
-			)
-			last_out_log_index = find_index_in_dict(reversed(logs), "log_type", "OUT")
-			last_out_log = (
-				logs[len(logs) - 1 - last_out_log_index]
-				if last_out_log_index or last_out_log_index == 0
-				else None
-			)
+			first_in_log, last_out_log = get_first_in_and_last_out_logs(logs)
 			if first_in_log and last_out_log:
 				in_time, out_time = first_in_log.time, last_out_log.time
 				total_hours = time_diff_in_hours(in_time, out_time)
@@ -281,22 +282,25 @@ def calculate_working_hours(logs, check_in_out_type, working_hours_calc_type):
 
 
 def time_diff_in_hours(start, end):
-	return round(float((end - start).total_seconds()) / 3600, 2)
+	return round((end - start).total_seconds() / 3600, 2)
 
 
-def find_index_in_dict(dict_list, key, value):
-	return next((index for (index, d) in enumerate(dict_list) if d[key] == value), None)
+def get_first_in_and_last_out_logs(logs):
+	"""Returns the first IN log and the last OUT log in a single pass over the logs"""
+	first_in_log = last_out_log = None
+	for log in logs:
+		if first_in_log is None and log.log_type == "IN":
+			first_in_log = log
+		if log.log_type == "OUT":
+			last_out_log = log
+
+	return first_in_log, last_out_log
 
 
 def handle_attendance_exception(log_names: list, error_message: str):
 	frappe.db.rollback(save_point="attendance_creation")
 	frappe.clear_messages()
-	skip_attendance_in_checkins(log_names)
-	add_comment_in_checkins(log_names, error_message)
-
-
-def add_comment_in_checkins(log_names: list, error_message: str):
-	text = "{0}<br>{1}".format(frappe.bold(_("Reason for skipping auto attendance:")), error_message)
+	skip_and_comment_in_checkins(log_names, error_message)
 
 
 def time_in_range(start, end, value):
@@ -307,26 +311,36 @@ def time_in_range(start, end, value):
 		return start <= value or value <= end
 
 
-def add_comment_in_checkins(log_names, duplicate, overlapping):
-	if duplicate:
-		text = _("Auto Attendance skipped due to duplicate attendance record: {}").format(
-			get_link_to_form("Attendance", duplicate[0].name)
-		)
-	else:
-		text = _("Auto Attendance skipped due to overlapping attendance record: {}").format(
-			get_link_to_form("Attendance", overlapping.name)
-		)
+def skip_and_comment_in_checkins(log_names: list, error_message: str):
+	"""Marks the logs to skip auto attendance and comments the reason on them,
+	with one update and one insert in the current transaction"""
+	skip_attendance_in_checkins(log_names)
+	add_comment_in_checkins(log_names, error_message)
 
-	for name in log_names:
-		frappe.get_doc(
-			{
-				"doctype": "Comment",
-				"comment_type": "Comment",
-				"reference_doctype": "Employee Checkin",
-				"reference_name": name,
-				"content": text,
-			}
-		).insert(ignore_permissions=True)
+
+def add_comment_in_checkins(log_names: list, error_message: str):
+	text = "{0}<br>{1}".format(frappe.bold(_("Reason for skipping auto attendance:")), error_message)
+	now = now_datetime()
+	user = frappe.session.user
+
+	frappe.db.bulk_insert(
+		"Comment",
+		fields=[
+			"name",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"comment_type",
+			"reference_doctype",
+			"reference_name",
+			"content",
+		],
+		values=[
+			(frappe.generate_hash(length=10), now, now, user, user, "Comment", "Employee Checkin", name, text)
+			for name in log_names
+		],
+	)
 
 
 def skip_attendance_in_checkins(log_names: list):
@@ -365,195 +379,266 @@ def notification_employee_with_logtype(logType):
 		],
 	)
 
-	for emp in employee_docs:
-		checkin_docs = frappe.db.get_all(
-			"Employee Checkin",
-			filters={
-				"employee": emp.employee,
-				"created_at": ['=', now],
-			},
-			order_by='time desc',
-			fields=['log_type']
-		)
+	latest_log_types = get_latest_log_types(now)
 
-		if not checkin_docs:
+	for emp in employee_docs:
+		if emp.employee not in latest_log_types:
 			notifications[emp.user_id] = "IN"
-			continue	
-
-		latest = checkin_docs[0].log_type
-		if logType == "IN" and latest == "IN": 
-			employeesPass.append(emp.user_id)
 			continue
 
-		if logType == "OUT" and latest == "IN":
-			notifications[emp.user_id] = "OUT"
+		action = NOTIFICATION_ACTIONS.get((logType, latest_log_types[emp.employee]))
+		if not action:
 			continue
 
-		if logType == "OUT" and latest == "OUT":
+		if action == "pass":
 			employeesPass.append(emp.user_id)
-			continue
-
-		if logType == "IN" and latest == "OUT":
-			notifications[emp.user_id] = "IN"
-			continue
+		else:
+			notifications[emp.user_id] = action
 
 	url = config["msteam_bot"]
 	payload = {"type": "CHECK_IN", "payloads": [json.dumps(notifications)]}
 
-	response = requests.post(url=url, json=payload)
-	result = response.text
-	print(result)
+	response = requests.post(url, json=payload, timeout=NOTIFICATION_TIMEOUT)
+	frappe.logger("hrms.checkin").debug(response.text)
 	# Handler push message error here
 
 
+def get_latest_log_types(date) -> dict:
+	"""Returns a map of employee to the log type of their latest checkin created on `date`"""
+	logs = frappe.db.sql(
+		"""
+		SELECT ec.employee, ec.log_type
+		FROM `tabEmployee Checkin` ec
+		INNER JOIN (
+			SELECT employee, MAX(time) AS max_time
+			FROM `tabEmployee Checkin`
+			WHERE created_at = %s
+			GROUP BY employee
+		) latest ON latest.employee = ec.employee AND latest.max_time = ec.time
+		WHERE ec.created_at = %s
+		""",
+		(date, date),
+		as_dict=True,
+	)
+
+	return {log.employee: log.log_type for log in logs}
+
+
 def summarize_attendances_leaves_today():
-  now = getdate()
-  next_month = getdate() + relativedelta(months=+1)
-  config = config_env_service()
-	
-  first_day_in_month = get_all_date_in_month(now.month, now.year)[0]
-  last_day_in_next_month = get_all_date_in_month(next_month.month, next_month.year)[-1]
-
-  empLeaves = {}
-  empCheckIns = {}
-  empNotCheckIns = {}
-  empLateEntry = {}
-  notifications = {}
-
-  employee_docs = frappe.db.get_all(
-    "Employee",
-    filters={
-			"status": ['=', 'Active'],
+	now = getdate()
+	config = config_env_service()
+
+	notifications = {"leaves": {}, "notCheckIns": {}, "lateEntries": {}, "checkIns": {}}
+
+	employee_docs = frappe.db.get_all(
+		"Employee",
+		filters={
+			"status": ["=", "Active"],
 		},
-    fields=[
+		fields=[
 			"employee",
 			"employee_name",
 			"user_id",
 		],
 	)
-  
-  for emp in employee_docs:
-    leaves = frappe.db.get_all(
-		"Leave Application",
-		fields=[
-			"name",
-			"leave_type",
-			"from_date",
-			"to_date",
-		],
-		filters={
-			"employee": emp.employee,
-			"from_date": (">=", first_day_in_month),
-			"to_date": ("<=", last_day_in_next_month),
-		},
-	)
-    
-    if leaves:
-      for dic in leaves:
-        from_date = getdate(dic["from_date"])
-        to_date = getdate(dic["to_date"])
-        is_leave_today = time_in_range(from_date, to_date, now)
-        if is_leave_today:
-          empLeaves[emp.user_id] = emp.employee_name
-      continue
-
-    checkin_docs = frappe.db.get_all(
-		"Employee Checkin",
-		filters={
-			"employee": emp.employee,
-			"created_at": ['=', now],
-		},
-		order_by='time desc',
-		fields=[
-			"time",
-			"log_type",
-			"shift_start",
-		]
-	)
 
-    if not checkin_docs:
-      empNotCheckIns[emp.user_id] = emp.employee_name
-      continue
+	for batch in create_batch(employee_docs, EMPLOYEE_CHUNK_SIZE):
+		for key, employees in summarize_employee_batch(batch, now).items():
+			notifications[key].update(employees)
 
-    first_in_log_index = find_index_in_dict(checkin_docs, "log_type", "IN")
-    first_in_log = (checkin_docs[first_in_log_index] if first_in_log_index or first_in_log_index == 0 else None)
-    if first_in_log:
-      if (first_in_log.time > checkin_docs[0].shift_start + timedelta(minutes=15)):
-        empLateEntry[emp.user_id] = emp.employee_name
-      empCheckIns[emp.user_id] = emp.employee_name
+	url = config["msteam_bot"]
+	payload = {"type": "SUMMARIZE_ATTENDANCES_LEAVES_TODAY", "payloads": [json.dumps(notifications)]}
 
-  notifications["leaves"] = empLeaves
-  notifications["notCheckIns"] = empNotCheckIns
-  notifications["lateEntries"] = empLateEntry
-  notifications["checkIns"] = empCheckIns
+	response = requests.post(url, json=payload, timeout=NOTIFICATION_TIMEOUT)
+	frappe.logger("hrms.checkin").debug(response.text)
+	# Handler push message error here
 
-  url = config["msteam_bot"]
-  payload = {"type": "SUMMARIZE_ATTENDANCES_LEAVES_TODAY", "payloads": [json.dumps(notifications)]}
 
-  response = requests.post(url=url, json=payload)
-  result = response.text
-  print(result)
-	# Handler push message error here
+def summarize_employee_batch(employee_docs: list, date) -> dict[str, dict]:
+	"""Classifies a batch of employees for the daily summary.
+	Returns maps of user id to employee name keyed by "leaves", "notCheckIns", "lateEntries" and "checkIns"."""
+	empLeaves = {}
+	empNotCheckIns = {}
+	empLateEntry = {}
+	empCheckIns = {}
 
+	employee_ids = [emp.employee for emp in employee_docs]
+	on_leave = get_employees_on_leave(employee_ids, date)
+	first_checkins = get_first_checkins(employee_ids, date)
 
-def employee_auto_checkout():
-	now = nowdate()
-	timestamp = now_datetime().__str__()[:-7]
+	for emp in employee_docs:
+		if emp.employee in on_leave:
+			empLeaves[emp.user_id] = emp.employee_name
+			continue
+
+		checkin = first_checkins.get(emp.employee)
+		if not checkin:
+			empNotCheckIns[emp.user_id] = emp.employee_name
+			continue
+
+		if checkin.first_in:
+			if checkin.shift_start and checkin.first_in > checkin.shift_start + timedelta(minutes=15):
+				empLateEntry[emp.user_id] = emp.employee_name
+			empCheckIns[emp.user_id] = emp.employee_name
+
+	return {
+		"leaves": empLeaves,
+		"notCheckIns": empNotCheckIns,
+		"lateEntries": empLateEntry,
+		"checkIns": empCheckIns,
+	}
+
+
+def get_employees_on_leave(employees: list, date) -> set:
+	"""Returns the set of employees having an approved leave application that covers `date`"""
+	if not employees:
+		return set()
+
+	return set(
+		frappe.db.sql_list(
+			"""
+			SELECT DISTINCT employee
+			FROM `tabLeave Application`
+			WHERE employee IN %(employees)s
+				AND docstatus = 1
+				AND status = 'Approved'
+				AND from_date <= %(date)s
+				AND to_date >= %(date)s
+			""",
+			{"employees": employees, "date": date},
+		)
+	)
+
+
+def get_first_checkins(employees: list, date) -> dict:
+	"""Returns a map of employee to their first IN time and shift start for checkins created on `date`.
+	Employees with checkins but no IN log are mapped with `first_in` as None."""
+	if not employees:
+		return {}
+
+	checkins = frappe.db.sql(
+		"""
+		SELECT
+			employee,
+			MIN(CASE WHEN log_type = 'IN' THEN time END) AS first_in,
+			MIN(CASE WHEN log_type = 'IN' THEN shift_start END) AS shift_start
+		FROM `tabEmployee Checkin`
+		WHERE employee IN %(employees)s
+			AND created_at = %(date)s
+		GROUP BY employee
+		""",
+		{"employees": employees, "date": date},
+		as_dict=True,
+	)
+
+	return {checkin.employee: checkin for checkin in checkins}
+
+
+def employee_auto_checkout(date=None):
+	now = date or nowdate()
+	timestamp = now_datetime().replace(microsecond=0)
 	config = config_env_service()
+	user = frappe.session.user
 
 	employee_doc = frappe.db.get_all(
-	"Employee",
-	filters={
-			"status": ['=', 'Active'],
+		"Employee",
+		filters={
+			"status": ["=", "Active"],
 		},
-	fields=[
+		fields=[
 			"employee",
 			"employee_name",
-		]
+		],
 	)
 
-	for emp in employee_doc:
-		checkin_docs = frappe.db.get_all(
-			"Employee Checkin",
-			filters={
-				"employee": emp.employee,
-				"created_at": ['=', now],
-			},
-			order_by='time desc',
-			fields=['log_type']
-		)
+	latest_log_types = get_latest_log_types(now)
+	autoname = frappe.get_meta("Employee Checkin").autoname
+	values = []
 
-		if not checkin_docs:
-			continue	
-
-		latest = checkin_docs[0].log_type
-		if latest == "OUT":
+	for emp in employee_doc:
+		if emp.employee not in latest_log_types or latest_log_types[emp.employee] == "OUT":
 			continue
 
-		doc = frappe.new_doc("Employee Checkin")
-		doc.employee = emp.employee
-		doc.employee_name = emp.employee_name
-		doc.time = timestamp
-		doc.created_at = now
-		doc.device_id = config["server_ip"]
-		doc.log_type = "OUT"
-		doc.auto_check_out = "1"
-		doc.insert()
+		shift = shift_actual_start = shift_actual_end = shift_start = shift_end = None
+		shift_actual_timings = get_actual_start_end_datetime_of_shift(
+			emp.employee, timestamp, True
+		)
+		if shift_actual_timings:
+			shift = shift_actual_timings.shift_type.name
+			shift_actual_start = shift_actual_timings.actual_start
+			shift_actual_end = shift_actual_timings.actual_end
+			shift_start = shift_actual_timings.start_datetime
+			shift_end = shift_actual_timings.end_datetime
+
+		values.append(
+			(
+				make_autoname(autoname, "Employee Checkin"),
+				timestamp,
+				timestamp,
+				user,
+				user,
+				emp.employee,
+				emp.employee_name,
+				timestamp,
+				now,
+				config["server_ip"],
+				"OUT",
+				1,
+				shift,
+				shift_actual_start,
+				shift_actual_end,
+				shift_start,
+				shift_end,
+			)
+		)
+
+	# checkouts are inserted directly, skipping per document validations and hooks
+	frappe.db.bulk_insert(
+		"Employee Checkin",
+		fields=[
+			"name",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"employee",
+			"employee_name",
+			"time",
+			"created_at",
+			"device_id",
+			"log_type",
+			"auto_check_out",
+			"shift",
+			"shift_actual_start",
+			"shift_actual_end",
+			"shift_start",
+			"shift_end",
+		],
+		values=values,
+	)
 	frappe.db.commit()
 	return True
 
 
+# notification jobs are moved to the long queue, they go over every active employee
+# and should neither block short jobs nor hit the default queue's timeout
 def process_notification_employee_with_check_IN():
-	notification_employee_with_logtype("IN")
+	frappe.enqueue(notification_employee_with_logtype, queue="long", timeout=1500, logType="IN")
 
 
 def process_notification_employee_with_check_OUT():
-	notification_employee_with_logtype("OUT")
+	frappe.enqueue(notification_employee_with_logtype, queue="long", timeout=1500, logType="OUT")
 
 
 def process_employee_auto_checkout():
-	employee_auto_checkout()
+	# runs in the scheduled job itself so the OUT logs are in before the 23:45 auto attendance
+	employee_auto_checkout(date=nowdate())
 
 
 def process_notification_to_bo_at_eleven_hours():
-	summarize_attendances_leaves_today()
+	frappe.enqueue(summarize_attendances_leaves_today, queue="long", timeout=1500)
+
+
+def on_doctype_update():
+	frappe.db.add_index("Employee Checkin", ["employee", "created_at", "time"])
+	frappe.db.add_index("Employee Checkin", ["employee", "time", "log_type"])
@@ -21,11 +21,19 @@ from erpnext.setup.doctype.holiday_list.test_holiday_list import set_holiday_lis
 from hrms.hr.doctype.employee_checkin.employee_checkin import (
 	add_log_based_on_employee_field,
 	calculate_working_hours,
+	employee_auto_checkout,
 	mark_attendance_and_link_log,
+	summarize_employee_batch,
+)
+from hrms.hr.doctype.leave_application.test_leave_application import (
+	get_first_sunday,
+	make_allocation_record,
 )
-from hrms.hr.doctype.leave_application.test_leave_application import get_first_sunday
 from hrms.hr.doctype.shift_type.test_shift_type import make_shift_assignment, setup_shift_type
-from hrms.payroll.doctype.salary_slip.test_salary_slip import make_holiday_list
+from hrms.payroll.doctype.salary_slip.test_salary_slip import (
+	make_holiday_list,
+	make_leave_application,
+)
 
 
 class TestEmployeeCheckin(FrappeTestCase):
@@ -76,6 +84,26 @@ class TestEmployeeCheckin(FrappeTestCase):
 		)
 		self.assertEqual(attendance_count, 1)
 
+	def test_skip_logs_on_duplicate_attendance(self):
+		employee = make_employee("test_duplicate_attendance@example.com")
+		now_date = nowdate()
+		frappe.db.delete("Attendance", {"employee": employee})
+		mark_attendance_and_link_log(make_n_checkins(employee, 2, 4), "Present", now_date, 8)
+
+		logs = make_n_checkins(employee, 3, 2)
+		attendance = mark_attendance_and_link_log(logs, "Present", now_date, 8)
+		self.assertIsNone(attendance)
+
+		for log in logs:
+			self.assertEqual(frappe.db.get_value("Employee Checkin", log.name, "skip_auto_attendance"), 1)
+			comments = frappe.get_all(
+				"Comment",
+				filters={"reference_doctype": "Employee Checkin", "reference_name": log.name},
+				pluck="content",
+			)
+			self.assertEqual(len(comments), 1)
+			self.assertIn("Reason for skipping auto attendance", comments[0])
+
 	def test_unlink_attendance_on_cancellation(self):
 		employee = make_employee("test_mark_attendance_and_link_log@example.com")
 		logs = make_n_checkins(employee, 3)
@@ -481,6 +509,120 @@ class TestEmployeeCheckin(FrappeTestCase):
 		log = make_checkin(employee, timestamp)
 		self.assertEqual(log.shift, shift2.name)
 
+	def test_summarize_employee_batch_leaves(self):
+		frappe.db.delete("Leave Application")
+		if not frappe.db.exists("Leave Type", "_Test Leave Type"):
+			frappe.get_doc(
+				dict(leave_type_name="_Test Leave Type", doctype="Leave Type", include_holiday=True)
+			).insert()
+
+		today = getdate()
+		tomorrow = add_days(today, 1)
+		employees = {}
+		for key in ["approved", "rejected", "other_day"]:
+			employee = make_employee(f"test_summary_{key}@example.com", company="_Test Company")
+			make_allocation_record(employee=employee, from_date=today, to_date=add_days(today, 30))
+			employees[key] = employee
+
+		make_leave_application(employees["approved"], today, today, "_Test Leave Type")
+		make_leave_application(employees["other_day"], tomorrow, tomorrow, "_Test Leave Type")
+		rejected = make_leave_application(
+			employees["rejected"], today, today, "_Test Leave Type", submit=False
+		)
+		rejected.status = "Rejected"
+		rejected.submit()
+
+		employee_docs = frappe.db.get_all(
+			"Employee",
+			filters={"name": ["in", list(employees.values())]},
+			fields=["employee", "employee_name", "user_id"],
+		)
+		user_ids = {emp.employee: emp.user_id for emp in employee_docs}
+		summary = summarize_employee_batch(employee_docs, today)
+
+		self.assertEqual(list(summary["leaves"]), [user_ids[employees["approved"]]])
+		self.assertIn(user_ids[employees["rejected"]], summary["notCheckIns"])
+		self.assertIn(user_ids[employees["other_day"]], summary["notCheckIns"])
+		self.assertEqual(summary["checkIns"], {})
+
+	def test_summarize_employee_batch_checkins(self):
+		# shift setup for 8-12
+		shift_type = setup_shift_type()
+		date = getdate()
+		employees = {}
+		for key in ["on_time", "late", "only_out", "no_shift"]:
+			employees[key] = make_employee(f"test_summary_{key}@example.com", company="_Test Company")
+			if key != "no_shift":
+				make_shift_assignment(shift_type.name, employees[key], date)
+
+		logs = [
+			make_checkin(employees["on_time"], datetime.combine(date, get_time("08:10:00"))),
+			make_checkin(employees["late"], datetime.combine(date, get_time("08:30:00"))),
+			make_checkin(employees["only_out"], datetime.combine(date, get_time("12:00:00"))),
+			make_checkin(employees["no_shift"], datetime.combine(date, get_time("09:00:00"))),
+		]
+		# an OUT log before the late IN should not count as the first check-in
+		logs.append(make_checkin(employees["late"], datetime.combine(date, get_time("08:05:00"))))
+		logs[-1].db_set("log_type", "OUT")
+		logs[2].db_set("log_type", "OUT")
+		for log in logs:
+			log.db_set("created_at", nowdate())
+		self.assertIsNone(logs[3].shift_start)
+
+		employee_docs = frappe.db.get_all(
+			"Employee",
+			filters={"name": ["in", list(employees.values())]},
+			fields=["employee", "employee_name", "user_id"],
+		)
+		user_ids = {emp.employee: emp.user_id for emp in employee_docs}
+		summary = summarize_employee_batch(employee_docs, date)
+
+		self.assertEqual(list(summary["lateEntries"]), [user_ids[employees["late"]]])
+		self.assertEqual(
+			set(summary["checkIns"]),
+			{user_ids[employees[key]] for key in ["on_time", "late", "no_shift"]},
+		)
+		# checkins without an IN log are neither checked in nor missing a check-in
+		self.assertEqual(summary["notCheckIns"], {})
+		self.assertEqual(summary["leaves"], {})
+
+	def test_employee_auto_checkout(self):
+		checked_in = make_employee("test_auto_checkout_in@example.com", company="_Test Company")
+		checked_out = make_employee("test_auto_checkout_out@example.com", company="_Test Company")
+
+		shift_type = setup_shift_type(
+			shift_type="Auto Checkout Shift", start_time="00:00:00", end_time="23:59:00"
+		)
+		make_shift_assignment(shift_type.name, checked_in, getdate())
+
+		logs = [
+			make_checkin(checked_in, now_datetime() - timedelta(minutes=1)),
+			make_checkin(checked_out, now_datetime() - timedelta(minutes=2)),
+		]
+		out_log = make_checkin(checked_out, now_datetime() - timedelta(minutes=1))
+		out_log.db_set("log_type", "OUT")
+		for log in logs + [out_log]:
+			log.db_set("created_at", nowdate())
+
+		employee_auto_checkout()
+
+		auto_logs = frappe.get_all(
+			"Employee Checkin",
+			filters={"auto_check_out": 1},
+			fields=["name", "employee", "log_type", "shift", "shift_start", "shift_end"],
+		)
+		self.assertEqual(len(auto_logs), 1)
+
+		auto_log = auto_logs[0]
+		self.assertEqual(auto_log.employee, checked_in)
+		self.assertEqual(auto_log.log_type, "OUT")
+		self.assertTrue(auto_log.name.startswith("EMP-CKIN-"))
+		self.assertEqual(auto_log.shift, shift_type.name)
+		self.assertIsNotNone(auto_log.shift_start)
+		self.assertIsNotNone(auto_log.shift_end)
+
+		self.assertEqual(frappe.db.count("Employee Checkin", {"employee": checked_out}), 2)
+
 
 def make_n_checkins(employee, n, hours_to_reverse=1):
 	logs = [make_checkin(employee, now_datetime() - timedelta(hours=hours_to_reverse, minutes=n + 1))]
@@ -233,3 +233,6 @@ def expire_carried_forward_allocation(allocation):
 
 def on_doctype_update():
 	frappe.db.add_index("Leave Ledger Entry", ["transaction_type", "transaction_name"])
+	frappe.db.add_index(
+		"Leave Ledger Entry", ["employee", "leave_type", "transaction_type", "from_date", "to_date"]
+	)
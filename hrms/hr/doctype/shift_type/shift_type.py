@@ -15,10 +15,8 @@ from erpnext.setup.doctype.holiday_list.holiday_list import is_holiday
 
 from hrms.hr.doctype.attendance.attendance import mark_attendance
 from hrms.hr.doctype.employee_checkin.employee_checkin import (
-	time_in_range,
-	find_index_in_dict,
+	calculate_working_hours_by_shift_type,
 	mark_attendance_and_link_log,
- 	calculate_working_hours_by_shift_type,
 )
 from hrms.hr.doctype.shift_assignment.shift_assignment import get_employee_shift, get_shift_details
 from hrms.utils import get_date_range
@@ -2,11 +2,12 @@
 # For license information, please see license.txt
 
 
-from itertools import groupby
+from itertools import chain
 
 import frappe
 from frappe import _
-from frappe.utils import add_days, cint, flt, getdate
+from frappe.utils import add_days, cint, create_batch, flt, getdate
+from frappe.utils.caching import request_cache
 
 from hrms.hr.doctype.leave_allocation.leave_allocation import get_previous_allocation
 from hrms.hr.doctype.leave_application.leave_application import (
@@ -16,6 +17,9 @@ from hrms.hr.doctype.leave_application.leave_application import (
 
 Filters = frappe._dict
 
+EMPLOYEE_CHUNK_SIZE = 500
+ROW_LIMIT = 50_000
+
 
 def execute(filters: Filters | None = None) -> tuple:
 	if filters.to_date <= filters.from_date:
@@ -152,44 +156,91 @@ def get_data(filters: Filters) -> list:
 	)
 
 	consolidate_employee_name = len(employees) > 1 and filters.consolidate_employee_name
-	row = None
 	data = []
 
-	for emp in employees:
+	for batch in create_batch(employees, EMPLOYEE_CHUNK_SIZE):
+		leaves_by_employee = get_leaves_by_employee(
+			batch, filters, with_employee_name=not consolidate_employee_name
+		)
+
 		if consolidate_employee_name:
-			data.append({"employee_name": emp.employee_name})
+			for emp in batch:
+				# employees without leaves in the period get no header row
+				if leaves := leaves_by_employee.get(emp.name):
+					data.append({"employee_name": emp.employee_name})
+					data.extend(leaves)
 		else:
-			row = frappe._dict({"employee_name": emp.employee_name})
-
-		leaves = frappe.db.get_list(
-			"Leave Application",
-			fields="*",
-			filters={
-				"employee_name": emp.employee_name,
-				"from_date": ["between", (filters.from_date, filters.to_date)],
-				"to_date": ["between", (filters.from_date, filters.to_date)],
-			},
-			order_by="posting_date desc"
-		)
+			data.extend(
+				chain.from_iterable(leaves_by_employee.get(emp.name, []) for emp in batch)
+			)
 
-		for leave in leaves:
-			if consolidate_employee_name:
-				row = frappe._dict()
-			else:
-				row = frappe._dict({"employee_name": emp.employee_name})
-
-			row.leave_type = leave.leave_type
-			row.from_date = leave.from_date
-			row.to_date = leave.to_date
-			row.leave_approver_name = leave.leave_approver_name
-			row.status = leave.status
-			row.total_leave_days = str(round(leave.total_leave_days, 1))
-			row.posting_date = leave.posting_date
-			row.indent = 1
-			data.append(row)
+		if len(data) > ROW_LIMIT:
+			frappe.throw(
+				_("The report has more than {0} rows, please narrow down the filters.").format(ROW_LIMIT),
+				title=_("Too Many Rows"),
+			)
 
 	return data
 
+
+def get_leaves_by_employee(
+	employees: list, filters: Filters, with_employee_name: bool = True
+) -> dict[str, list]:
+	"""Returns report rows for the leave applications of all the employees in one permission
+	checked query, grouped by employee"""
+	leaves_by_employee = {}
+	if not employees:
+		return leaves_by_employee
+
+	# names come from the Employee records, matching the consolidated header rows
+	employee_names = {emp.name: emp.employee_name for emp in employees}
+	leaves = frappe.get_list(
+		"Leave Application",
+		fields=[
+			"employee",
+			"leave_type",
+			"from_date",
+			"to_date",
+			"leave_approver_name",
+			"status",
+			"total_leave_days",
+			"posting_date",
+		],
+		filters={
+			"employee": ["in", list(employee_names)],
+			# leaves overlapping the period, including the ones straddling its boundaries
+			"from_date": ["<=", filters.to_date],
+			"to_date": [">=", filters.from_date],
+		},
+		order_by="posting_date desc",
+	)
+
+	# rows repeat the employee name only when they are not grouped under employee header rows
+	if with_employee_name:
+		for leave in leaves:
+			leaves_by_employee.setdefault(leave.employee, []).append(
+				{"employee_name": employee_names[leave.employee], **get_leave_row(leave)}
+			)
+	else:
+		for leave in leaves:
+			leaves_by_employee.setdefault(leave.employee, []).append(get_leave_row(leave))
+
+	return leaves_by_employee
+
+
+def get_leave_row(leave: dict) -> dict:
+	return {
+		"leave_type": leave.leave_type,
+		"from_date": leave.from_date,
+		"to_date": leave.to_date,
+		"leave_approver_name": leave.leave_approver_name,
+		"status": leave.status,
+		"total_leave_days": str(round(flt(leave.total_leave_days), 1)),
+		"posting_date": leave.posting_date,
+		"indent": 1,
+	}
+
+
 # def get_data(filters: Filters) -> List:
 # 	leave_types = frappe.db.get_list("Leave Type", pluck="name", order_by="name")
 # 	conditions = get_conditions(filters)
@@ -250,6 +301,7 @@ def get_data(filters: Filters) -> list:
 # 	return data
 
 
+@request_cache
 def get_leave_types() -> list[str]:
 	LeaveType = frappe.qb.DocType("Leave Type")
 	return (frappe.qb.from_(LeaveType).select(LeaveType.name).orderby(LeaveType.name)).run(
@@ -320,30 +372,6 @@ def get_conditions(filters: Filters) -> dict:
 	return conditions
 
 
-def get_department_leave_approver_map(department = None):
-	# get current department and all its child
-	department_list = frappe.get_list(
-		"Department",
-		filters={"disabled": 0},
-		or_filters={"name": department, "parent_department": department},
-		pluck="name",
-	)
-	# retrieve approvers list from current department and from its subsequent child departments
-	approver_list = frappe.get_all(
-		"Department Approver",
-		filters={"parentfield": "leave_approvers", "parent": ("in", department_list)},
-		fields=["parent", "approver"],
-		as_list=True,
-	)
-
-	approvers = {}
-
-	for k, v in approver_list:
-		approvers.setdefault(k, []).append(v)
-
-	return approvers
-
-
 def get_allocated_and_expired_leaves(
 	from_date: str, to_date: str, employee: str, leave_type: str
 ) -> tuple[float, float, float]:
@@ -352,6 +380,7 @@ def get_allocated_and_expired_leaves(
 	carry_forwarded_leaves = 0
 
 	records = get_leave_ledger_entries(from_date, to_date, employee, leave_type)
+	period_start, period_end = getdate(from_date), getdate(to_date)
 
 	for record in records:
 		# new allocation records with `is_expired=1` are created when leave expires
@@ -359,7 +388,7 @@ def get_allocated_and_expired_leaves(
 		if record.is_expired:
 			continue
 
-		if record.to_date < getdate(to_date):
+		if record.to_date < period_end:
 			# leave allocations ending before to_date, reduce leaves taken within that period
 			# since they are already used, they won't expire
 			expired_leaves += record.leaves
@@ -368,7 +397,7 @@ def get_allocated_and_expired_leaves(
 			)
 			expired_leaves -= min(abs(leaves_for_period), record.leaves)
 
-		if record.from_date >= getdate(from_date):
+		if record.from_date >= period_start:
 			if record.is_carry_forward:
 				carry_forwarded_leaves += record.leaves
 			else:
@@ -429,18 +458,14 @@ def get_chart_data(data: list, filters: Filters) -> dict:
 
 
 def get_dataset_for_chart(employee_data: list, datasets: list, labels: list) -> list:
-	leaves = []
-	employee_data = sorted(employee_data, key=lambda k: k["employee_name"])
+	seen_employees = set()
 
-	for key, group in groupby(employee_data, lambda x: x["employee_name"]):
-		for grp in group:
-			if grp.closing_balance:
-				leaves.append(
-					frappe._dict({"leave_type": grp.leave_type, "closing_balance": grp.closing_balance})
-				)
+	for row in employee_data:
+		if not row.get("closing_balance"):
+			continue
 
-		if leaves:
-			labels.append(key)
+		if row["employee_name"] not in seen_employees:
+			seen_employees.add(row["employee_name"])
+			labels.append(row["employee_name"])
 
-	for leave in leaves:
-		datasets.append({"name": leave.leave_type, "values": [leave.closing_balance]})
+		datasets.append({"name": row["leave_type"], "values": [row["closing_balance"]]})
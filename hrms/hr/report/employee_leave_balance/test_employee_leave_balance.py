@@ -1,6 +1,7 @@
 # Copyright (c) 2021, Frappe Technologies Pvt. Ltd. and Contributors
 # License: GNU General Public License v3. See license.txt
 
+from unittest.mock import patch
 
 import frappe
 from frappe.tests.utils import FrappeTestCase
@@ -12,7 +13,10 @@ from erpnext.setup.doctype.holiday_list.test_holiday_list import set_holiday_lis
 from hrms.hr.doctype.leave_application.test_leave_application import make_allocation_record
 from hrms.hr.doctype.leave_ledger_entry.leave_ledger_entry import process_expired_allocation
 from hrms.hr.doctype.leave_type.test_leave_type import create_leave_type
-from hrms.hr.report.employee_leave_balance.employee_leave_balance import execute
+from hrms.hr.report.employee_leave_balance.employee_leave_balance import (
+	execute,
+	get_conditions,
+)
 from hrms.payroll.doctype.salary_slip.test_salary_slip import (
 	make_holiday_list,
 	make_leave_application,
@@ -205,6 +209,138 @@ class TestEmployeeLeaveBalance(FrappeTestCase):
 		)
 		self.assertEqual(report[1][0].opening_balance, opening_balance)
 
+	@set_holiday_list("_Test Emp Balance Holiday List", "_Test Company")
+	def test_leaves_straddling_period_boundaries(self):
+		frappe.get_doc(test_records[0]).insert()
+		make_allocation_record(
+			employee=self.employee_id, from_date=self.year_start, to_date=self.year_end
+		)
+
+		first_sunday = get_first_sunday(self.holiday_list, for_date=self.year_start)
+		# Monday to Thursday of the first week, crossing the period start
+		leave1 = make_leave_application(
+			self.employee_id, add_days(first_sunday, 1), add_days(first_sunday, 4), "_Test Leave Type"
+		)
+		# Monday to Thursday of the second week, crossing the period end
+		leave2 = make_leave_application(
+			self.employee_id, add_days(first_sunday, 8), add_days(first_sunday, 11), "_Test Leave Type"
+		)
+
+		filters = frappe._dict(
+			{
+				"from_date": add_days(first_sunday, 2),
+				"to_date": add_days(first_sunday, 9),
+				"employee": self.employee_id,
+			}
+		)
+		report = execute(filters)
+
+		rows = sorted(report[1], key=lambda row: row["from_date"])
+		self.assertEqual(
+			[(row["from_date"], row["to_date"]) for row in rows],
+			[
+				(getdate(leave1.from_date), getdate(leave1.to_date)),
+				(getdate(leave2.from_date), getdate(leave2.to_date)),
+			],
+		)
+
+	@set_holiday_list("_Test Emp Balance Holiday List", "_Test Company")
+	def test_leaves_of_employees_with_the_same_name(self):
+		frappe.get_doc(test_records[0]).insert()
+		first_sunday = get_first_sunday(self.holiday_list, for_date=self.year_start)
+
+		leaves = {}
+		for i, user in enumerate(["test_same_name1@example.com", "test_same_name2@example.com"]):
+			employee = make_employee(user, company="_Test Company", first_name="_Test Same Name")
+			make_allocation_record(employee=employee, from_date=self.year_start, to_date=self.year_end)
+			# a different week for each employee
+			from_date = add_days(first_sunday, 1 + 7 * i)
+			leaves[employee] = make_leave_application(
+				employee, from_date, add_days(from_date, 1), "_Test Leave Type"
+			)
+
+		for employee, leave in leaves.items():
+			filters = frappe._dict(
+				{"from_date": self.year_start, "to_date": self.year_end, "employee": employee}
+			)
+			report = execute(filters)
+			self.assertEqual(
+				[(row["employee_name"], row["from_date"]) for row in report[1]],
+				[("_Test Same Name", getdate(leave.from_date))],
+			)
+
+	@set_holiday_list("_Test Emp Balance Holiday List", "_Test Company")
+	def test_consolidated_header_rows(self):
+		frappe.get_doc(test_records[0]).insert()
+		make_employee("test_emp_without_leaves@example.com", company="_Test Company")
+		make_allocation_record(
+			employee=self.employee_id, from_date=self.year_start, to_date=self.year_end
+		)
+		first_sunday = get_first_sunday(self.holiday_list, for_date=self.year_start)
+		leave_application = make_leave_application(
+			self.employee_id, add_days(first_sunday, 1), add_days(first_sunday, 2), "_Test Leave Type"
+		)
+
+		filters = frappe._dict(
+			{
+				"from_date": self.year_start,
+				"to_date": self.year_end,
+				"company": "_Test Company",
+				"consolidate_employee_name": 1,
+			}
+		)
+		report = execute(filters)
+
+		# only the employee with leaves gets a header row, followed by their leave rows
+		employee_name = frappe.db.get_value("Employee", self.employee_id, "employee_name")
+		self.assertEqual(len(report[1]), 2)
+		self.assertEqual(report[1][0], {"employee_name": employee_name})
+		self.assertNotIn("employee_name", report[1][1])
+		self.assertEqual(report[1][1]["from_date"], getdate(leave_application.from_date))
+
+	@set_holiday_list("_Test Emp Balance Holiday List", "_Test Company")
+	def test_employee_batches_and_row_limit(self):
+		frappe.get_doc(test_records[0]).insert()
+		first_sunday = get_first_sunday(self.holiday_list, for_date=self.year_start)
+
+		employee_names = set()
+		for i in range(3):
+			employee = make_employee(f"test_emp_batch{i}@example.com", company="_Test Company")
+			make_allocation_record(employee=employee, from_date=self.year_start, to_date=self.year_end)
+			make_leave_application(
+				employee, add_days(first_sunday, 1), add_days(first_sunday, 2), "_Test Leave Type"
+			)
+			employee_names.add(frappe.db.get_value("Employee", employee, "employee_name"))
+
+		filters = frappe._dict(
+			{
+				"from_date": self.year_start,
+				"to_date": self.year_end,
+				"company": "_Test Company",
+				"consolidate_employee_name": 1,
+			}
+		)
+		module = "hrms.hr.report.employee_leave_balance.employee_leave_balance"
+
+		# one employee per batch, header rows should still follow the employee order
+		with patch(f"{module}.EMPLOYEE_CHUNK_SIZE", 1):
+			report = execute(filters)
+
+		expected_order = [
+			name
+			for name in frappe.get_list(
+				"Employee", filters=get_conditions(filters), pluck="employee_name"
+			)
+			if name in employee_names
+		]
+		self.assertEqual(
+			[row["employee_name"] for row in report[1] if "indent" not in row], expected_order
+		)
+		self.assertEqual(len(report[1]), 6)
+
+		with patch(f"{module}.EMPLOYEE_CHUNK_SIZE", 1), patch(f"{module}.ROW_LIMIT", 2):
+			self.assertRaises(frappe.ValidationError, execute, filters)
+
 	@set_holiday_list("_Test Emp Balance Holiday List", "_Test Company")
 	def test_employee_status_filter(self):
 		frappe.get_doc(test_records[0]).insert()